@@ -1,38 +1,61 @@
-import csv
+import atexit
+import functools
+import json
 import os
 import uuid
 from datetime import datetime
 from typing import Dict, Optional, TypedDict, List, Tuple
+import threading
 import tiktoken
 import sys
+import asyncio
+import httpx
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
 # Constants
 FINAL_ANSWER_MARKER = "[FINAL_ANSWER]"
 
-def validate_final_answer_with_llm(content: str, original_query: str) -> Tuple[bool, str, Optional[str]]:
-    """Validate and clean a final answer, checking only format requirements.
-    
-    Args:
-        content: The content to validate
-        original_query: The original user query that led to this answer
-    
-    Returns:
-        Tuple[bool, str, Optional[str]]: (is_valid, content, feedback)
-        - is_valid: Whether the answer meets the format requirements
-        - content: The cleaned content if valid, original content if invalid
-        - feedback: Validation feedback if invalid, None if valid
-    """
-    print("\n=== Starting Final Answer Validation ===")
-    print("Validating response format...")
-    
-    validator_llm = ChatOpenAI(
-        temperature=0,  # Use 0 temperature for consistent validation
-        model="gpt-4o-mini",
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
-    
-    system_prompt = """You are a specialized validation agent responsible for ensuring final answers meet the required format.
+# One HTTP transport shared by every ChatOpenAI client in the process: a
+# single keep-alive pool amortizes TCP/TLS setup across agents and turns
+# instead of paying a handshake per client
+_HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+SHARED_HTTP_CLIENT = httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+SHARED_HTTP_ASYNC_CLIENT = httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+
+def _close_http_clients() -> None:
+    """Best-effort shutdown of the shared HTTP pools at process exit."""
+    SHARED_HTTP_CLIENT.close()
+    try:
+        asyncio.run(SHARED_HTTP_ASYNC_CLIENT.aclose())
+    except RuntimeError:
+        # An event loop is still running (or already closed); the sockets
+        # are reclaimed by the OS at exit anyway
+        pass
+
+atexit.register(_close_http_clients)
+
+# Validator LLM client, built lazily (after load_dotenv has run) and reused
+# across validations so the underlying HTTP connection pool persists
+_VALIDATOR_LLM: Optional[ChatOpenAI] = None
+
+def _get_validator_llm() -> ChatOpenAI:
+    """Return the shared validator ChatOpenAI client, creating it on first use."""
+    global _VALIDATOR_LLM
+    if _VALIDATOR_LLM is None:
+        _VALIDATOR_LLM = ChatOpenAI(
+            temperature=0,  # Use 0 temperature for consistent validation
+            model="gpt-4o-mini",
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=2,
+            http_client=SHARED_HTTP_CLIENT,
+            http_async_client=SHARED_HTTP_ASYNC_CLIENT
+        )
+    return _VALIDATOR_LLM
+
+# Built once at import; the validator's system message never changes
+_VALIDATOR_SYSTEM_PROMPT = """You are a specialized validation agent responsible for ensuring final answers meet the required format.
 Your task is to:
 1. Check if the answer follows the correct format
 2. If needed, reformat the answer to meet requirements
@@ -57,6 +80,47 @@ If the format needs fixing:
 3. Add [FINAL_ANSWER] on its own line if missing
 4. Return the reformatted version in cleaned_content"""
 
+_VALIDATOR_SYSTEM_MESSAGE = {"role": "system", "content": _VALIDATOR_SYSTEM_PROMPT}
+
+# Memoized validator verdicts keyed by (content, original_query). The
+# validator runs at temperature 0, so revalidating identical content — e.g.
+# an agent resubmitting the same answer after feedback — is a wasted LLM
+# round-trip. Error results are never cached so transient failures retry.
+_VALIDATION_CACHE: Dict[Tuple[str, str], Tuple[bool, str, Optional[str]]] = {}
+_VALIDATION_CACHE_SIZE = 128
+
+def validate_final_answer_with_llm(content: str, original_query: str) -> Tuple[bool, str, Optional[str]]:
+    """Validate and clean a final answer, checking only format requirements.
+
+    Results are memoized per (content, original_query), so resubmissions of
+    identical content skip the validator LLM call.
+
+    Args:
+        content: The content to validate
+        original_query: The original user query that led to this answer
+
+    Returns:
+        Tuple[bool, str, Optional[str]]: (is_valid, content, feedback)
+        - is_valid: Whether the answer meets the format requirements
+        - content: The cleaned content if valid, original content if invalid
+        - feedback: Validation feedback if invalid, None if valid
+    """
+    key = (content, original_query)
+    cached = _VALIDATION_CACHE.get(key)
+    if cached is not None:
+        return cached
+    result = _validate_final_answer_uncached(content, original_query)
+    if result[0] and len(_VALIDATION_CACHE) < _VALIDATION_CACHE_SIZE:
+        _VALIDATION_CACHE[key] = result
+    return result
+
+def _validate_final_answer_uncached(content: str, original_query: str) -> Tuple[bool, str, Optional[str]]:
+    """Run the validator LLM on a final answer (no memoization)."""
+    print("\n=== Starting Final Answer Validation ===")
+    print("Validating response format...")
+    
+    validator_llm = _get_validator_llm()
+
     user_prompt = f"""Format this final answer:
 
 {content}
@@ -66,13 +130,12 @@ Return a JSON response indicating if the format is valid and provide a cleaned v
     try:
         response = validator_llm.invoke(
             [
-                {"role": "system", "content": system_prompt},
+                _VALIDATOR_SYSTEM_MESSAGE,
                 {"role": "user", "content": user_prompt}
             ]
         )
         
         # Parse the JSON response
-        import json
         result = json.loads(response.content)
         
         if result["is_valid"] and not result["needs_reformatting"]:
@@ -113,27 +176,37 @@ def create_agent(name: str, system_prompt: str, temperature: float = 0.7) -> Age
 
 def create_collaboration_context(current_agent: AgentConfig, all_agents: List[AgentConfig]) -> str:
     """Create context about collaboration team and guidelines.
-    
+
     Args:
         current_agent: Configuration for the current agent
         all_agents: List of all agent configurations in the collaboration
-    
+
     Returns:
         str: Collaboration context and guidelines
     """
+    # The context only depends on the agent names and system prompts, which
+    # never change during a run, so build it once per team composition
+    return _collaboration_context_cached(
+        current_agent["name"],
+        tuple((agent["name"], agent["system_prompt"]) for agent in all_agents)
+    )
+
+@functools.lru_cache(maxsize=32)
+def _collaboration_context_cached(current_name: str, roster: Tuple[Tuple[str, str], ...]) -> str:
+    """Build the collaboration context for a given agent and team roster."""
     # Create team roster excluding current agent
     team_roster = "\n".join([
-        f"- {agent['name']}: {agent['system_prompt']}"
-        for agent in all_agents
-        if agent['name'] != current_agent['name']
+        f"- {name}: {system_prompt}"
+        for name, system_prompt in roster
+        if name != current_name
     ])
-    
+
     return f'''You are part of a collaborative team working together to solve problems.
 Your teammates are:
 
 {team_roster}
 
-IMPORTANT: You are ONLY {current_agent["name"]}. Do NOT attempt to role-play or generate responses for other agents.
+IMPORTANT: You are ONLY {current_name}. Do NOT attempt to role-play or generate responses for other agents.
 Each agent will contribute their own responses in turn. Focus solely on your role and expertise.
 
 Guidelines for Natural Collaboration:
@@ -356,50 +429,268 @@ Language Learning App Core Features:
 
 def create_agent_prompt(agent_config: AgentConfig, message_history: str, all_agents: List[AgentConfig]) -> str:
     """Create a prompt for an agent including system prompt, collaboration context, and instructions.
-    
+
     Args:
         agent_config: Configuration for the agent
         message_history: List of previous messages in the conversation
         all_agents: List of all agent configurations in the collaboration
-    
+
     Returns:
         str: The complete prompt for the agent
     """
-    base_prompt = f"""You are {agent_config['name']}.
+    # Everything except the message history is fixed per (agent, team), so
+    # only the final concatenation happens per turn
+    prefix = _prompt_prefix_cached(
+        agent_config["name"],
+        agent_config["system_prompt"],
+        tuple((agent["name"], agent["system_prompt"]) for agent in all_agents)
+    )
+    return prefix + message_history
 
-{agent_config['system_prompt']}
+@functools.lru_cache(maxsize=32)
+def _prompt_prefix_cached(name: str, system_prompt: str, roster: Tuple[Tuple[str, str], ...]) -> str:
+    """Build the static prompt prefix for an agent, up to the message history."""
+    return _system_prefix_cached(name, system_prompt, roster) + "\n\nPrevious conversation:\n"
 
-{create_collaboration_context(agent_config, all_agents)}
+@functools.lru_cache(maxsize=32)
+def _system_prefix_cached(name: str, system_prompt: str, roster: Tuple[Tuple[str, str], ...]) -> str:
+    """Build the history-independent part of an agent's prompt."""
+    return f"""You are {name}.
 
-Previous conversation:
-{message_history}"""
-    
-    return base_prompt
+{system_prompt}
+
+{_collaboration_context_cached(name, roster)}"""
+
+@functools.lru_cache(maxsize=32)
+def _system_message_cached(name: str, system_prompt: str, roster: Tuple[Tuple[str, str], ...]) -> SystemMessage:
+    """Build the reusable SystemMessage carrying an agent's static prefix."""
+    return SystemMessage(content=_system_prefix_cached(name, system_prompt, roster))
+
+def create_agent_messages(agent_config: AgentConfig, message_history: str, all_agents: List[AgentConfig]) -> List[BaseMessage]:
+    """Create the chat messages for an agent turn with a stable system prefix.
+
+    The static identity, system prompt and collaboration context are sent as
+    a byte-identical SystemMessage on every turn, with only the conversation
+    history in the user message, so provider-side prompt caches can reuse
+    the prefix's prefill across turns and agents.
+
+    Args:
+        agent_config: Configuration for the agent
+        message_history: The joined conversation history
+        all_agents: List of all agent configurations in the collaboration
+
+    Returns:
+        List[BaseMessage]: [system message, user message] for the LLM call
+    """
+    roster = tuple((agent["name"], agent["system_prompt"]) for agent in all_agents)
+    system_message = _system_message_cached(
+        agent_config["name"], agent_config["system_prompt"], roster
+    )
+    return [
+        system_message,
+        HumanMessage(content=f"Previous conversation:\n{message_history}")
+    ]
+
+def create_agent_messages_builder(agent_config: AgentConfig, all_agents: List[AgentConfig]):
+    """Partially evaluate create_agent_messages for a fixed agent and team.
+
+    The roster tuple and cached SystemMessage are resolved once here, so a
+    per-turn call only wraps the history in a HumanMessage instead of
+    rebuilding the tuple and re-consulting the cache.
+
+    Args:
+        agent_config: Configuration for the agent
+        all_agents: List of all agent configurations in the collaboration
+
+    Returns:
+        Callable[[str], List[BaseMessage]]: renders the turn's messages
+        from a message history
+    """
+    roster = tuple((agent["name"], agent["system_prompt"]) for agent in all_agents)
+    system_message = _system_message_cached(
+        agent_config["name"], agent_config["system_prompt"], roster
+    )
+
+    def build_messages(message_history: str) -> List[BaseMessage]:
+        return [
+            system_message,
+            HumanMessage(content=f"Previous conversation:\n{message_history}")
+        ]
+
+    return build_messages
+
+# Model-name -> tiktoken encoding, resolved once per model instead of
+# walking the tiktoken registry on every count
+_ENCODINGS: Dict[str, "tiktoken.Encoding"] = {}
+
+def _get_encoding(model: str) -> "tiktoken.Encoding":
+    """Return the cached tiktoken encoding for a model, resolving it once."""
+    encoding = _ENCODINGS.get(model)
+    if encoding is None:
+        encoding = _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+    return encoding
+
+def _approx_token_count(text: str) -> int:
+    """Estimate a token count as ~1.3 tokens per word without tokenizing.
+
+    Counts separators instead of materializing a word list, and stays in
+    integer arithmetic throughout.
+    """
+    return (text.count(" ") + 1) * 13 // 10
+
+@functools.lru_cache(maxsize=4096)
+def _cached_token_count(text: str, model: str) -> int:
+    """Tokenize a text string, memoizing the result for repeated content."""
+    return len(_get_encoding(model).encode(text))
 
 def count_tokens(text: str, model: str = "gpt-4") -> int:
-    """Count the number of tokens in a text string."""
+    """Count the number of tokens in a text string.
+
+    Args:
+        text: The text to count tokens for
+        model: The model whose tokenizer should be used (default: "gpt-4")
+
+    Returns:
+        int: The token count
+    """
+    if not text:
+        return 0
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
+        return _cached_token_count(text, model)
     except Exception:
         # Fallback to approximate token count if tiktoken fails
-        return len(text.split()) * 1.3
+        return _approx_token_count(text)
+
+def count_tokens_batch(texts: List[str], model: str = "gpt-4") -> List[int]:
+    """Count tokens for several texts with a single batched encode call.
+
+    Args:
+        texts: The text strings to count tokens for
+        model: The model whose tokenizer should be used (default: "gpt-4")
+
+    Returns:
+        List[int]: Token counts in the same order as the input texts
+    """
+    try:
+        encoding = _get_encoding(model)
+        return [len(tokens) for tokens in encoding.encode_batch(texts)]
+    except Exception:
+        # Fallback to approximate token counts if tiktoken fails
+        return [_approx_token_count(text) for text in texts]
+
+# CSV logging
+CSV_FIELDNAMES = ["agent_name", "output", "input_tokens", "output_tokens", "timestamp"]
+CSV_FLUSH_EVERY = 8  # Rows buffered before flushing to disk
+
+def _format_csv_field(value) -> str:
+    """Render one CSV field, quoting only when the value requires it."""
+    text = str(value)
+    if '"' in text or ',' in text or '\n' in text or '\r' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+def _format_csv_row(values) -> str:
+    """Render a full CSV record as a single string."""
+    return ",".join(_format_csv_field(value) for value in values) + "\r\n"
+
+# Header rendered and encoded once for all log files
+_CSV_HEADER = _format_csv_row(CSV_FIELDNAMES).encode("utf-8")
+
+class _CsvWriter:
+    """Buffered CSV writer bound to a single log file.
+
+    Keeps one file handle open for the lifetime of the process and lets rows
+    accumulate in the handle's buffer, flushing every CSV_FLUSH_EVERY rows
+    (or immediately when a row is written with durable=True) instead of
+    paying open + write + fsync + close syscalls per entry. Rows are
+    rendered to one string and written with a single write() call rather
+    than going through the csv module's per-field dispatch.
+    """
+
+    def __init__(self, path: str):
+        file_exists = os.path.exists(path)
+        # Binary append mode: rows are encoded once here, skipping the text
+        # layer's newline translation and incremental encoder
+        self._file = open(path, mode='ab')
+        if not file_exists:
+            self._file.write(_CSV_HEADER)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def write_row(self, row: Dict, durable: bool = False) -> None:
+        """Buffer a row, flushing when the batch is full or durability is requested."""
+        line = _format_csv_row(row[field] for field in CSV_FIELDNAMES).encode("utf-8")
+        with self._lock:
+            self._file.write(line)
+            self._pending += 1
+            if durable:
+                self._flush_locked()
+                # fdatasync skips the metadata flush where the platform offers
+                # it (Linux/macOS); fall back to a full fsync elsewhere
+                if hasattr(os, "fdatasync"):
+                    os.fdatasync(self._file.fileno())
+                else:
+                    os.fsync(self._file.fileno())
+            elif self._pending >= CSV_FLUSH_EVERY:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self._file.flush()
+        self._pending = 0
+
+    def flush(self) -> None:
+        """Write any buffered rows through to the operating system."""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+
+# One writer per log file, shared across all callers in the process
+_CSV_WRITERS: Dict[str, _CsvWriter] = {}
+
+def _get_csv_writer(path: str) -> _CsvWriter:
+    """Return the persistent writer for a log file, creating it on first use."""
+    writer = _CSV_WRITERS.get(path)
+    if writer is None:
+        writer = _CSV_WRITERS[path] = _CsvWriter(path)
+    return writer
+
+def flush_csv_writers() -> None:
+    """Flush all buffered conversation log rows to disk."""
+    for writer in _CSV_WRITERS.values():
+        writer.flush()
+
+def _close_csv_writers() -> None:
+    """Flush and close all open conversation log handles at shutdown."""
+    for writer in _CSV_WRITERS.values():
+        writer.close()
+    _CSV_WRITERS.clear()
+
+atexit.register(_close_csv_writers)
 
 def save_conversation_to_csv(
     agent_name: str,
     output: str,
     input_history: str,
-    csv_file: Optional[str] = None
+    csv_file: Optional[str] = None,
+    durable: bool = False,
+    input_tokens: Optional[int] = None
 ) -> str:
     """
     Save a conversation entry to a CSV file.
-    
+
     Args:
         agent_name: Name of the agent (e.g., "Agent 1", "Agent 2", "Human")
         output: The agent's response
         input_history: The input history provided to the agent
         csv_file: Optional path to existing CSV file. If None, creates new file.
-    
+        durable: If True, fsync the row to disk before returning.
+        input_tokens: Precomputed token count for input_history. If None,
+            the history is tokenized here.
+
     Returns:
         str: Path to the CSV file
     """
@@ -414,9 +705,12 @@ def save_conversation_to_csv(
             os.makedirs("conversation_logs", exist_ok=True)
             csv_file = os.path.join("conversation_logs", csv_file)
         
-        # Calculate token counts
-        input_tokens = count_tokens(input_history)
-        output_tokens = count_tokens(output)
+        # Calculate token counts, skipping the history re-tokenization when
+        # the caller already tracks it incrementally
+        if input_tokens is None:
+            input_tokens, output_tokens = count_tokens_batch([input_history, output])
+        else:
+            output_tokens = count_tokens(output)
         
         # Prepare the row data
         row_data = {
@@ -427,16 +721,9 @@ def save_conversation_to_csv(
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Add timestamp for each entry
         }
         
-        # Write to CSV
-        file_exists = os.path.exists(csv_file)
-        with open(csv_file, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=row_data.keys())
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(row_data)
-            f.flush()  # Ensure immediate write to disk
-            os.fsync(f.fileno())  # Force the operating system to write to disk
-        
+        # Write to CSV through the persistent buffered writer
+        _get_csv_writer(csv_file).write_row(row_data, durable=durable)
+
         return csv_file
     
     except Exception as e:
@@ -1,18 +1,28 @@
-from typing import TypedDict, List, Dict, Union, Tuple, Optional
+from typing import Annotated, TypedDict, List, Dict, Union, Tuple, Optional
+import asyncio
+import functools
+import hashlib
+import operator
 import os
+import re
 import uuid
+from collections import OrderedDict
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, END
 from langgraph.types import interrupt, Command
 from langgraph.checkpoint.memory import MemorySaver
 from helper_functions import (
-    save_conversation_to_csv, 
-    create_agent_prompt, 
+    save_conversation_to_csv,
+    flush_csv_writers,
+    create_agent_messages,
+    create_agent_messages_builder,
+    count_tokens,
     AgentConfig,
     FINAL_ANSWER_MARKER,
-    validate_final_answer_with_llm
+    validate_final_answer_with_llm,
+    SHARED_HTTP_CLIENT,
+    SHARED_HTTP_ASYNC_CLIENT
 )
 
 # Load environment variables
@@ -21,58 +31,94 @@ load_dotenv()
 # Task to be completed
 INITIAL_TASK = "Let's brainstorm ideas for a new mobile app that helps people learn languages. What features should we include?"
 
+# Matches the consensus vote phrase without lowercasing whole messages
+VOTE_PATTERN = re.compile(r"i vote to submit", re.IGNORECASE)
+
+# The prompts require stop directives ("[FINAL_ANSWER]", "I vote to submit")
+# on their own line at the END of a message, so checks only inspect the last
+# few dozen characters instead of scanning the whole response every hop
+_MARKER_TAIL = 64
+
+def _has_final_answer(message: str) -> bool:
+    """True if the message ends with the final-answer marker."""
+    return FINAL_ANSWER_MARKER in message[-_MARKER_TAIL:]
+
+def _has_vote(message: str) -> bool:
+    """True if the message ends with the consensus vote phrase."""
+    return VOTE_PATTERN.search(message, max(0, len(message) - _MARKER_TAIL)) is not None
+
 # Constants
 MAX_ITERATIONS = 20  # Increased to allow for more iterations before safety cutoff
 DEBUGGING_MODE = False
 MAX_ERRORS = 3  # Maximum number of consecutive errors before exiting
+# When True, all agents respond to the same history concurrently each round
+# instead of taking sequential turns; cuts per-round latency to the slowest
+# single LLM call at the cost of agents not seeing each other mid-round
+PARALLEL_AGENTS = False
+# Cap on how many recent messages agents see per turn (0 = unbounded).
+# Bounding the window keeps per-turn prompt tokens — and LLM cost — constant
+# as the conversation grows instead of linear in its length
+HISTORY_WINDOW = 0
+# When True, each agent turn speculatively starts the next agent's LLM call
+# as soon as its own response has validated, so the next network round-trip
+# overlaps this turn's CSV write, checkpointing and display work. Wrong
+# guesses (validation retries, human interrupts) are simply discarded: the
+# speculative result is keyed by the exact prompt it answered
+SPECULATIVE_PREFETCH = False
 
 # Define state
 class AgentState(TypedDict):
-    messages: List[str]
+    # Reducer channel: nodes return only the new messages and LangGraph
+    # appends them, so no node copies the whole transcript per turn
+    messages: Annotated[List[str], operator.add]
     phase: int
     iteration: int
     csv_file: str
-    agents: List[AgentConfig]  # Track agent configurations
+    original_query: str  # The user's task, stored once instead of re-parsed
+    history_tokens: int  # Rolling token count of the joined history
+    history_str: str  # Incrementally maintained "\n"-joined messages
+    next_agent_idx: int  # Index into agents of the next agent to speak
+    consecutive_votes: int  # Run of trailing agent messages that voted to submit
+
+@functools.lru_cache(maxsize=32)
+def _role_split_re(other_agents: Tuple[str, ...]):
+    """Compiled alternation matching any other agent's role-play prefix.
 
-def validate_message(content: str, agent_name: str, all_agent_names: List[str], original_query: str, messages: List[str]) -> Tuple[str, Optional[str]]:
+    One regex pass over the content replaces the per-agent substring scans;
+    cached per roster since agent names never change mid-run.
+    """
+    parts = []
+    for name in other_agents:
+        parts.append(re.escape(f"{name}:"))
+        parts.append(re.escape(f"**{name}:**"))
+    return re.compile("|".join(parts))
+
+def validate_message(content: str, agent_name: str, all_agent_names: List[str], original_query: str, messages: List[str], consecutive_votes: int) -> Tuple[str, Optional[str]]:
     """Validate that the message follows proper format and doesn't contain role-playing.
-    
+
     Args:
         content: The message content to validate
         agent_name: The name of the current agent
         all_agent_names: List of all agent names
         original_query: The original user query
         messages: List of all previous messages
-    
+        consecutive_votes: How many trailing agent messages voted to submit
+
     Returns:
         Tuple[str, Optional[str]]: (validated_content, validation_feedback)
     """
-    # Remove the current agent from the list to check
-    other_agents = [name for name in all_agent_names if name != agent_name]
-    
-    # Check for and remove role-playing attempts
-    for other_agent in other_agents:
-        if f"{other_agent}:" in content:
-            content = content.split(f"{other_agent}:")[0].strip()
-    
-    # Check for other common role-playing indicators
-    indicators = ["**" + name + ":**" for name in other_agents]
-    for indicator in indicators:
-        if indicator in content:
-            content = content.split(indicator)[0].strip()
-    
-    # Get the last three non-feedback messages
-    vote_messages = []
-    for msg in reversed(messages):
-        if not msg.startswith("Validation Feedback:") and not msg.startswith("Human:") and not msg.startswith("User Query:"):
-            vote_messages.append(msg)
-            if len(vote_messages) == 3:
-                break
-    
+    # Truncate at the first role-playing attempt (another agent's "Name:"
+    # or "**Name:**" prefix) in a single compiled-regex pass
+    other_agents = tuple(name for name in all_agent_names if name != agent_name)
+    if other_agents:
+        m = _role_split_re(other_agents).search(content)
+        if m:
+            content = content[:m.start()].strip()
+
     # Check if this is a final answer
     if FINAL_ANSWER_MARKER in content:
         # Check if we have three consecutive "vote to submit" messages
-        if len(vote_messages) == 3 and all("i vote to submit" in msg.lower() for msg in vote_messages):
+        if consecutive_votes >= 3:
             # Print the final answer before validation
             print("\nFinal Answer:")
             print(content)
@@ -88,157 +134,527 @@ def validate_message(content: str, agent_name: str, all_agent_names: List[str],
             return content.replace(FINAL_ANSWER_MARKER, "").strip(), "Final answer can only be provided after three consecutive agents have voted to submit"
     
     # Check for consensus building
-    if "i vote to submit" in content.lower():
+    if _has_vote(content):
         # Check if this is too early (not enough discussion)
-        if len(messages) < 3 and not any("i vote to submit" in msg.lower() for msg in messages):
+        if len(messages) < 3 and not any(_has_vote(msg) for msg in messages):
             return content, "Please engage in thorough discussion before voting to submit"
-        
+
         # If we have three consecutive "vote to submit" messages, remind the last agent to provide final answer
-        if len(vote_messages) == 3 and all("i vote to submit" in msg.lower() for msg in vote_messages):
+        if consecutive_votes >= 3:
             return content, "Consensus reached! As the last agent to vote, please provide the final answer following the format guidelines."
     
     return content, None
 
-def create_agent_node(agent_config: AgentConfig):
+# One ChatOpenAI client per temperature, shared across agents and turns so
+# the underlying HTTP connection pool is reused instead of rebuilt per call
+_llm_cache: Dict[float, ChatOpenAI] = {}
+
+def _llm_for(temperature: float) -> ChatOpenAI:
+    """Return the shared ChatOpenAI client for a temperature."""
+    llm = _llm_cache.get(temperature)
+    if llm is None:
+        llm = _llm_cache[temperature] = ChatOpenAI(
+            temperature=temperature,
+            model="gpt-4o-mini",
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=2,
+            http_client=SHARED_HTTP_CLIENT,
+            http_async_client=SHARED_HTTP_ASYNC_CLIENT
+        )
+    return llm
+
+# Global cap on in-flight LLM calls so parallel rounds, speculative
+# prefetch and the validator cannot stack enough concurrent requests to
+# trip provider rate limits
+_LLM_SEMAPHORE = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+async def _sem_ainvoke(llm: ChatOpenAI, prompt):
+    """Invoke the LLM under the global concurrency cap."""
+    async with _LLM_SEMAPHORE:
+        return await llm.ainvoke(prompt)
+
+# Bounded LRU of prompt-hash -> response content, so identical LLM calls
+# (e.g. validation-feedback retries of the temperature-0 Critical Agent)
+# skip the network round-trip. Only deterministic (temperature=0) calls are
+# served from cache: replaying a stored response at higher temperatures
+# would silently defeat sampling
+RESPONSE_CACHE_SIZE = 128
+_response_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_response_cache_stats = {"hits": 0, "misses": 0}
+
+def _response_cache_key(temperature: float, prompt) -> bytes:
+    text = prompt if isinstance(prompt, str) else "\x00".join(m.content for m in prompt)
+    return hashlib.blake2b(f"{temperature}\x00{text}".encode(), digest_size=16).digest()
+
+def _response_cache_get(key: bytes) -> Optional[str]:
+    cached = _response_cache.get(key)
+    if cached is not None:
+        _response_cache.move_to_end(key)
+    return cached
+
+def _response_cache_put(key: bytes, content: str) -> None:
+    _response_cache[key] = content
+    if len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+# Speculative calls in flight, keyed by the same prompt hash as the response
+# cache; a prefetch is only ever consumed by the exact prompt it answered
+_prefetch_tasks: Dict[bytes, asyncio.Task] = {}
+
+async def _astream_content(llm: ChatOpenAI, prompt) -> str:
+    """Stream a response and accumulate its text.
+
+    Consuming the SSE stream directly means chunks are handled as the model
+    generates them rather than assembled into one response object at the
+    end, and gives later consumers (progress display, early stop checks) an
+    obvious seam without changing the call sites.
+    """
+    parts: List[str] = []
+    async with _LLM_SEMAPHORE:
+        async for chunk in llm.astream(prompt):
+            if chunk.content:
+                parts.append(chunk.content)
+    return "".join(parts)
+
+async def _ainvoke_llm_cached(llm: ChatOpenAI, temperature: float, prompt) -> str:
+    """Invoke the LLM, deduplicating identical (temperature, prompt) calls."""
+    key = _response_cache_key(temperature, prompt)
+    deterministic = temperature == 0
+    if deterministic:
+        cached = _response_cache_get(key)
+        if cached is not None:
+            _response_cache_stats["hits"] += 1
+            return cached
+        _response_cache_stats["misses"] += 1
+    task = _prefetch_tasks.pop(key, None)
+    if task is not None:
+        try:
+            response = await task
+            if deterministic:
+                _response_cache_put(key, response.content)
+            return response.content
+        except Exception:
+            # Speculative call failed; fall through to a fresh request
+            pass
+    content = await _astream_content(llm, prompt)
+    if deterministic:
+        _response_cache_put(key, content)
+    return content
+
+def _maybe_prefetch_next(state: AgentState, agents: List[AgentConfig], agent_idx: int, new_message: str) -> None:
+    """Speculatively start the next agent's LLM call for the updated history.
+
+    Routing is deterministic round-robin, so once this turn's message is
+    final the next agent's prompt is fully known. Keep at most one
+    speculative call in flight; anything older answers a history that no
+    longer exists and is cancelled.
+    """
+    next_agent = agents[(agent_idx + 1) % len(agents)]
+    next_state = {
+        "messages": state["messages"] + [new_message],
+        "history_str": state["history_str"] + f"\n{new_message}"
+    }
+    prompt = create_agent_messages(
+        agent_config=next_agent,
+        message_history=_windowed_history(next_state),
+        all_agents=agents
+    )
+    key = _response_cache_key(next_agent["temperature"], prompt)
+    if key in _response_cache or key in _prefetch_tasks:
+        return
+    for stale in _prefetch_tasks.values():
+        stale.cancel()
+    _prefetch_tasks.clear()
+    _prefetch_tasks[key] = asyncio.create_task(
+        _sem_ainvoke(_llm_for(next_agent["temperature"]), prompt)
+    )
+
+# Write-behind conversation logging: nodes enqueue rows and a single worker
+# coroutine performs the buffered disk writes, so the graph moves on to the
+# next LLM call without waiting on file IO
+_log_queue: Optional[asyncio.Queue] = None
+_log_worker: Optional[asyncio.Task] = None
+
+async def _drain_log_queue() -> None:
+    """Consume queued log rows and write them off the critical path."""
+    while True:
+        kwargs = await _log_queue.get()
+        try:
+            await asyncio.to_thread(save_conversation_to_csv, **kwargs)
+        except Exception as e:
+            print(f"Failed to log conversation row: {e}")
+        finally:
+            _log_queue.task_done()
+
+def _enqueue_log(**kwargs) -> None:
+    """Queue a conversation row for the background log writer."""
+    global _log_queue, _log_worker
+    if _log_queue is None:
+        _log_queue = asyncio.Queue()
+        _log_worker = asyncio.create_task(_drain_log_queue())
+    _log_queue.put_nowait(kwargs)
+
+async def _settle_logs() -> None:
+    """Drain queued log rows, then flush writer buffers to disk."""
+    if _log_queue is not None:
+        await _log_queue.join()
+    await asyncio.to_thread(flush_csv_writers)
+
+def _windowed_history(state: AgentState) -> str:
+    """Return the prompt history, bounded to the recent window if configured.
+
+    The original user query is always kept at the top so agents never lose
+    the task; messages between it and the recent window are elided with a
+    marker rather than re-summarized, keeping this deterministic and cheap.
+    """
+    if not HISTORY_WINDOW or len(state["messages"]) <= HISTORY_WINDOW + 1:
+        return state["history_str"]
+    recent = state["messages"][-HISTORY_WINDOW:]
+    omitted = len(state["messages"]) - 1 - HISTORY_WINDOW
+    return "\n".join([
+        state["messages"][0],
+        f"[... {omitted} earlier messages omitted ...]",
+        *recent
+    ])
+
+def create_agent_node(agent_config: AgentConfig, agent_idx: int, agents: List[AgentConfig]):
     """Dynamically create an agent node function."""
-    def agent_node(state: AgentState) -> AgentState:
-        message_history = "\n".join(state["messages"])
-        
-        # Get the original query from the first message
-        original_query = state["messages"][0].split(":", 1)[1].strip()
+    # Per-call invariants are bound once here: the compiled self-prefix
+    # pattern (models rarely self-prefix, so the common case is a single
+    # failed anchor match), the shared LLM client for this temperature,
+    # and the partially evaluated prompt builder for this agent and team
+    num_agents = len(agents)
+    all_agent_names = [agent["name"] for agent in agents]
+    prefix_re = re.compile(rf"^{re.escape(agent_config['name'])}:\s*")
+    llm = _llm_for(agent_config["temperature"])
+    build_messages = create_agent_messages_builder(agent_config, agents)
+
+    async def agent_node(state: AgentState) -> AgentState:
+        message_history = _windowed_history(state)
+        original_query = state["original_query"]
         
         # Check if there's validation feedback in the last message
         validation_feedback = None
         if state["messages"] and state["messages"][-1].startswith("Validation Feedback:"):
             validation_feedback = state["messages"][-1].split(":", 1)[1].strip()
-            # Remove the validation feedback from message history
-            message_history = "\n".join(state["messages"][:-1])
+            # Slice the trailing feedback line (and its newline) off the history
+            message_history = message_history[:-(len(state["messages"][-1]) + 1)]
         
         # Add validation feedback to prompt if it exists
         if validation_feedback:
             message_history += f"\n\nPlease address the following validation issues:\n{validation_feedback}"
         
-        prompt = create_agent_prompt(
-            agent_config=agent_config,
-            message_history=message_history,
-            all_agents=state["agents"]
-        )
-        
-        llm = ChatOpenAI(
-            temperature=agent_config["temperature"],
-            model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        response = llm.invoke(prompt)
-        content = response.content
+        prompt = build_messages(message_history)
+
+        content = await _ainvoke_llm_cached(llm, agent_config["temperature"], prompt)
         
         # Remove agent name prefix if it exists
-        prefix = f"{agent_config['name']}: "
-        if content.startswith(prefix):
-            content = content[len(prefix):].strip()
-        
+        content = prefix_re.sub("", content, 1)
+
         # Validate message with original query
-        all_agent_names = [agent["name"] for agent in state["agents"]]
-        content, feedback = validate_message(content, agent_config["name"], all_agent_names, original_query, state["messages"])
+        content, feedback = validate_message(content, agent_config["name"], all_agent_names, original_query, state["messages"], state["consecutive_votes"])
         
         # If there's validation feedback, add it as a separate message
-        messages = state["messages"]
         if feedback:
-            messages = messages + [f"Validation Feedback: {feedback}"]
-            # Reset iteration to allow the agent to try again
+            feedback_message = f"Validation Feedback: {feedback}"
+            # Only return the changed keys; the messages reducer appends the
+            # delta. Iteration is deliberately not incremented for feedback
             return {
-                "messages": messages,
-                "phase": state["phase"],
-                "iteration": state["iteration"],  # Don't increment iteration for validation feedback
-                "csv_file": state["csv_file"],
-                "agents": state["agents"]
+                "messages": [feedback_message],
+                "history_tokens": state["history_tokens"] + count_tokens(f"\n{feedback_message}"),
+                "history_str": state["history_str"] + f"\n{feedback_message}"
             }
-        
-        # Log conversation
-        csv_file = save_conversation_to_csv(
-            agent_name=agent_config["name"],
-            output=content,
-            input_history=message_history,
-            csv_file=state.get("csv_file")
-        )
-        
+
+        new_message = f"{agent_config['name']}: {content}"
+
+        # Kick off the next agent's call before this turn's logging and
+        # checkpointing so the network round-trip overlaps that work
+        if SPECULATIVE_PREFETCH and state["iteration"] + 1 < MAX_ITERATIONS and not _has_final_answer(new_message):
+            _maybe_prefetch_next(state, agents, agent_idx, new_message)
+
+        # Log conversation write-behind; the prompt history token count is
+        # tracked incrementally in state except when validation feedback
+        # reshaped it. Only the very first row (no log path yet) is written
+        # inline, because it names the file
+        csv_file = state.get("csv_file")
+        input_tokens = None if validation_feedback else state["history_tokens"]
+        if csv_file:
+            _enqueue_log(
+                agent_name=agent_config["name"],
+                output=content,
+                input_history=message_history,
+                csv_file=csv_file,
+                input_tokens=input_tokens
+            )
+        else:
+            csv_file = await asyncio.to_thread(
+                save_conversation_to_csv,
+                agent_name=agent_config["name"],
+                output=content,
+                input_history=message_history,
+                csv_file=None,
+                input_tokens=input_tokens
+            )
+
         return {
-            "messages": messages + [f"{agent_config['name']}: {content}"],
-            "phase": state["phase"],
+            "messages": [new_message],
             "iteration": state["iteration"] + 1,
             "csv_file": csv_file,
-            "agents": state["agents"]
+            "history_tokens": state["history_tokens"] + count_tokens(f"\n{new_message}"),
+            "history_str": state["history_str"] + f"\n{new_message}",
+            "next_agent_idx": (agent_idx + 1) % num_agents,
+            "consecutive_votes": state["consecutive_votes"] + 1 if _has_vote(content) else 0
         }
     
     return agent_node
 
-def should_continue(state: AgentState) -> str:
-    """Determine next agent or human feedback.
-    
-    Returns the name of the next agent or "human" for feedback.
+def create_parallel_round(agents: List[AgentConfig]):
+    """Create a node that fans one round out to every agent concurrently."""
+    prefix_res = [
+        re.compile(rf"^{re.escape(agent['name'])}:\s*") for agent in agents
+    ]
+    builders = [create_agent_messages_builder(agent, agents) for agent in agents]
+    async def _gather_responses(prompts: List[List]) -> List[str]:
+        # Serve cache hits directly, then batch the remaining prompts per
+        # temperature so each shared client issues one abatch call
+        contents: List[Optional[str]] = []
+        pending: Dict[float, List[int]] = {}
+        for i, (agent, prompt) in enumerate(zip(agents, prompts)):
+            cached = None
+            if agent["temperature"] == 0:
+                cached = _response_cache_get(_response_cache_key(agent["temperature"], prompt))
+                _response_cache_stats["hits" if cached is not None else "misses"] += 1
+            contents.append(cached)
+            if cached is None:
+                pending.setdefault(agent["temperature"], []).append(i)
+
+        async def run_group(temperature: float, indices: List[int]) -> None:
+            async with _LLM_SEMAPHORE:
+                responses = await _llm_for(temperature).abatch([prompts[i] for i in indices])
+            for i, response in zip(indices, responses):
+                contents[i] = response.content
+                if temperature == 0:
+                    _response_cache_put(_response_cache_key(temperature, prompts[i]), response.content)
+
+        await asyncio.gather(*(
+            run_group(temperature, indices) for temperature, indices in pending.items()
+        ))
+        return contents
+
+    async def parallel_round(state: AgentState) -> AgentState:
+        message_history = _windowed_history(state)
+        original_query = state["original_query"]
+        all_agent_names = [agent["name"] for agent in agents]
+
+        prompts = [build(message_history) for build in builders]
+        responses = await _gather_responses(prompts)
+
+        # Clean and append responses in deterministic agent order; per-agent
+        # retry feedback does not apply when everyone answered the same
+        # history, so validation here only strips role-playing artifacts
+        messages = list(state["messages"])
+        new_messages: List[str] = []
+        votes = state["consecutive_votes"]
+        history_tokens = state["history_tokens"]
+        history_str = state["history_str"]
+        csv_file = state.get("csv_file")
+        for agent, prefix_re, content in zip(agents, prefix_res, responses):
+            content = prefix_re.sub("", content, 1)
+            content, _ = validate_message(content, agent["name"], all_agent_names, original_query, messages, votes)
+            votes = votes + 1 if _has_vote(content) else 0
+            if csv_file:
+                _enqueue_log(
+                    agent_name=agent["name"],
+                    output=content,
+                    input_history=message_history,
+                    csv_file=csv_file,
+                    input_tokens=history_tokens
+                )
+            else:
+                csv_file = await asyncio.to_thread(
+                    save_conversation_to_csv,
+                    agent_name=agent["name"],
+                    output=content,
+                    input_history=message_history,
+                    csv_file=None,
+                    input_tokens=history_tokens
+                )
+            new_message = f"{agent['name']}: {content}"
+            messages.append(new_message)
+            new_messages.append(new_message)
+            history_tokens += count_tokens(f"\n{new_message}")
+            history_str += f"\n{new_message}"
+
+        return {
+            "messages": new_messages,
+            "iteration": state["iteration"] + 1,
+            "csv_file": csv_file,
+            "history_tokens": history_tokens,
+            "history_str": history_str,
+            "consecutive_votes": votes
+        }
+
+    return parallel_round
+
+def create_should_continue_round(agents: List[AgentConfig]):
+    """Build the parallel-mode routing function: another round or human.
+
+    A round appends one message per agent, so the final-answer check must
+    cover all of the round's new messages — any agent may produce the
+    marker, not just the last one in roster order.
     """
-    # If there are no messages yet, start with the first agent
-    if not state["messages"]:
-        return state["agents"][0]["name"]
-    
-    # Get current agent index and calculate next
-    current_agent = state["messages"][-1].split(":")[0]
-    last_message = state["messages"][-1]
-    
-    # If the current message is from a human or user, start with first agent
-    if current_agent in ["Human", "User Query"]:
-        return state["agents"][0]["name"]
-    
-    # Check if we've reached max iterations
-    if state["iteration"] >= MAX_ITERATIONS:
-        return "human"
-    
-    # Check if final answer was provided
-    if FINAL_ANSWER_MARKER in last_message:
-        return "human"
-    
-    # Find current agent's index
-    current_idx = next(i for i, a in enumerate(state["agents"]) if a["name"] == current_agent)
-    next_idx = (current_idx + 1) % len(state["agents"])
-    next_agent = state["agents"][next_idx]["name"]
-    
-    return next_agent
+    num_agents = len(agents)
+
+    def should_continue_round(state: AgentState) -> str:
+        if state["iteration"] >= MAX_ITERATIONS:
+            return "human"
+        if any(_has_final_answer(msg) for msg in state["messages"][-num_agents:]):
+            return "human"
+        return "round"
+
+    return should_continue_round
+
+def create_should_continue(agents: List[AgentConfig]):
+    """Build the routing function with the agent roster bound in its closure.
+
+    The roster never changes mid-run, so it lives here rather than in
+    AgentState — the checkpointer no longer re-serializes the agent
+    configs on every step. The returned function gives the name of the
+    next agent, read straight from next_agent_idx, or "human" for feedback.
+    """
+    names = [agent["name"] for agent in agents]
+
+    def should_continue(state: AgentState) -> str:
+        # Check if we've reached max iterations
+        if state["iteration"] >= MAX_ITERATIONS:
+            return "human"
+
+        # Check if final answer was provided
+        if state["messages"] and _has_final_answer(state["messages"][-1]):
+            return "human"
+
+        return names[state["next_agent_idx"]]
+
+    return should_continue
 
 def human_feedback(state: AgentState) -> Command:
     """Get feedback from human and update state."""
-    message_history = "\n".join(state["messages"])
     feedback = interrupt("Need human feedback. Review the conversation and provide guidance.")
     
     if not feedback:
         return Command(goto=END)
     
-    # Return a Command that updates the state and continues to first agent
+    # Return a Command that updates the changed state keys and continues
+    # to the first agent; the messages reducer appends the delta
+    feedback_message = f"Human: {feedback}"
     return Command(
         update={
-            "messages": state["messages"] + [f"Human: {feedback}"],
+            "messages": [feedback_message],
             "phase": state["phase"] + 1,
             "iteration": 0,  # Reset iteration count after feedback
-            "csv_file": state["csv_file"],
-            "agents": state["agents"]
+            "history_tokens": state["history_tokens"] + count_tokens(f"\n{feedback_message}"),
+            "history_str": state["history_str"] + f"\n{feedback_message}",
+            "next_agent_idx": 0  # Feedback always restarts with the first agent
         }
     )
 
+class SelectiveMemorySaver(MemorySaver):
+    """MemorySaver that persists routine agent checkpoints lazily.
+
+    MemorySaver serializes the full state — including the growing message
+    transcript — on every node transition, yet this workflow only ever
+    re-enters the graph at a human-feedback interrupt or after an error.
+    Every checkpoint after the input one (metadata step >= 0) is therefore
+    withheld rather than stored; only its lineage config is returned. When
+    a checkpoint is about to be read — an interrupt attaching its pending
+    writes, or the driver calling persist_withheld() before resuming after
+    an error — every withheld put since the last stored checkpoint is
+    replayed in order. All of them are needed: MemorySaver writes channel
+    blobs only for the versions named in each individual put, so replaying
+    just the latest would lose any channel (phase, original_query, ...)
+    last written in an earlier withheld superstep.
+
+    Only metadata["step"] is consulted, which every langgraph release this
+    project has run against (0.3.x through 1.x) provides. The metadata
+    "writes" field is deliberately not used: it was removed from
+    CheckpointMetadata in langgraph 1.0, and keying on it would turn the
+    withholding into dead code there.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._withheld = []
+
+    def _replay_withheld(self) -> None:
+        """Store every withheld put, oldest first, then clear the backlog."""
+        for args in self._withheld:
+            super().put(*args)
+        self._withheld.clear()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        if metadata.get("step", -1) >= 0:
+            # Routine superstep: keep the checkpoint lineage without
+            # serializing the state payload, but remember the full put in
+            # case a later superstep interrupts or fails
+            self._withheld.append((config, checkpoint, metadata, new_versions))
+            return {
+                "configurable": {
+                    "thread_id": config["configurable"]["thread_id"],
+                    "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                    "checkpoint_id": checkpoint["id"]
+                }
+            }
+        # Eagerly stored checkpoints must not leapfrog withheld blobs their
+        # successors still reference
+        self._replay_withheld()
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        if self._withheld and any(channel == "__interrupt__" for channel, _ in writes):
+            # The interrupt landed on a withheld checkpoint; persist the
+            # backlog so resuming restores the full state
+            self._replay_withheld()
+        return super().put_writes(config, writes, task_id, *args, **kwargs)
+
+    def persist_withheld(self) -> None:
+        """Persist all withheld checkpoints, if any.
+
+        The driver calls this before resuming after an error, so recovery
+        retries only the failed superstep instead of replaying every turn
+        since the last stored checkpoint — which would re-bill those LLM
+        calls and re-log their rows.
+        """
+        self._replay_withheld()
+
 def create_workflow(agents: List[AgentConfig]) -> StateGraph:
     """Create workflow with dynamic agents."""
     workflow = StateGraph(AgentState)
-    
+
+    if PARALLEL_AGENTS:
+        # One fan-out node per round instead of sequential agent turns
+        workflow.add_node("round", create_parallel_round(agents))
+        workflow.add_node("human", human_feedback)
+        workflow.add_conditional_edges(
+            "round",
+            create_should_continue_round(agents),
+            {"round": "round", "human": "human"}
+        )
+        workflow.add_edge("human", "round")
+        workflow.set_entry_point("round")
+        return workflow
+
     # Add nodes for each agent
-    for agent in agents:
-        workflow.add_node(agent["name"], create_agent_node(agent))
+    for i, agent in enumerate(agents):
+        workflow.add_node(agent["name"], create_agent_node(agent, i, agents))
     
     # Add human node
     workflow.add_node("human", human_feedback)
-    
+
     # Add edges between agents
+    should_continue = create_should_continue(agents)
     for agent in agents:
         edges = {
-            next_agent["name"]: next_agent["name"] 
+            next_agent["name"]: next_agent["name"]
             for next_agent in agents + [{"name": "human"}]
         }
         workflow.add_conditional_edges(
@@ -255,8 +671,31 @@ def create_workflow(agents: List[AgentConfig]) -> StateGraph:
     
     return workflow
 
-def main():
-    """Main function to run the agent collaboration system."""
+@functools.lru_cache(maxsize=4)
+def _build_app_cached(agent_key: Tuple[Tuple[str, str, float], ...]):
+    agents = [
+        AgentConfig(name=name, system_prompt=system_prompt, temperature=temperature)
+        for name, system_prompt, temperature in agent_key
+    ]
+    return create_workflow(agents).compile(
+        checkpointer=SelectiveMemorySaver(), debug=DEBUGGING_MODE
+    )
+
+def build_app(agents: List[AgentConfig]):
+    """Return the compiled workflow for these agents, reusing prior compilations.
+
+    Compiling a StateGraph walks every node and edge to build its dispatch
+    tables; for a fixed roster that work is identical each time, so the
+    compiled app is cached on the roster itself. Sessions stay isolated via
+    their thread_id in the run config, not via fresh compilations.
+    """
+    return _build_app_cached(tuple(
+        (agent["name"], agent["system_prompt"], agent["temperature"])
+        for agent in agents
+    ))
+
+async def amain():
+    """Run the agent collaboration system on a single asyncio event loop."""
     # Get initial query
     query = INITIAL_TASK.strip()
     if not query:
@@ -289,7 +728,11 @@ def main():
         "phase": 1,
         "iteration": 0,
         "csv_file": None,  # Will be set by first save_conversation_to_csv call
-        "agents": agents
+        "original_query": query,
+        "history_tokens": count_tokens(f"User Query: {query}"),
+        "history_str": f"User Query: {query}",
+        "next_agent_idx": 0,
+        "consecutive_votes": 0
     }
     
     # Log the initial query
@@ -302,13 +745,10 @@ def main():
     initial_state["csv_file"] = csv_file
     print(f"Conversation will be logged to: {csv_file}")
     
-    # Create and run workflow
-    workflow = create_workflow(agents)
-    
-    # Initialize checkpointer and compile with debug
+    # Get the compiled workflow (cached per agent roster)
+    app = build_app(agents)
+    agent_names = {agent["name"] for agent in agents}
     thread_id = str(uuid.uuid4())
-    checkpointer = MemorySaver()
-    app = workflow.compile(checkpointer=checkpointer, debug=DEBUGGING_MODE)
     
     # Create config for the run
     config = {
@@ -318,69 +758,78 @@ def main():
         }
     }
     
-    # Run the workflow
-    state = initial_state
+    # Run the workflow. The initial state is submitted once; afterwards the
+    # graph is re-entered with Command(resume=...) after an interrupt or
+    # None after an error, both of which continue from the checkpoint —
+    # re-submitting the state dict would re-append the whole transcript
+    # through the messages reducer
+    stream_input: Union[AgentState, Command, None] = initial_state
     error_count = 0
-    last_valid_state = state  # Keep track of the last valid state
-    
+    last_valid_state = initial_state  # Driver-side view for display
+
     try:
         while True:
             try:
-                # If state is a Command, we need to stream it differently
-                if isinstance(state, Command):
-                    stream_input = state
-                    state = last_valid_state  # Use last valid state for agent name lookups
-                else:
-                    stream_input = state
-                    last_valid_state = state  # Update last valid state
-                    
-                for output in app.stream(stream_input, config):
-                    if isinstance(output, dict):
-                        if "__interrupt__" in output:
-                            # This is an interrupt
-                            interrupt_value = output["__interrupt__"][0].value
-                            print(f"\nHuman feedback needed: {interrupt_value}")
-                            feedback = input("Your feedback: ").strip()
-                            if not feedback:
-                                print("Ending conversation...")
-                                return
-                            
-                            # Log the human feedback
-                            message_history = "\n".join(last_valid_state["messages"])
-                            csv_file = save_conversation_to_csv(
-                                agent_name="Human",
-                                output=feedback,
-                                input_history=message_history,
-                                csv_file=last_valid_state["csv_file"]
-                            )
-                            
-                            # Create new state with the feedback
-                            new_state = {
-                                "messages": last_valid_state["messages"] + [f"Human: {feedback}"],
-                                "phase": last_valid_state["phase"] + 1,
-                                "iteration": 0,
-                                "csv_file": csv_file,
-                                "agents": last_valid_state["agents"]
-                            }
-                            
-                            # Create the command with the new state
-                            state = Command(resume=feedback, update=new_state)
-                            break
-                        else:
-                            # Display agent outputs
-                            for node, node_state in output.items():
-                                if isinstance(last_valid_state, dict) and node in [agent["name"] for agent in last_valid_state["agents"]]:
-                                    print(f"\nAgent {node} output:")
-                                    print(f"Phase: {node_state['phase']}, Iteration: {node_state['iteration']}")
-                                    print(node_state["messages"][-1])
-                                    state = node_state
-                                    last_valid_state = node_state  # Update last valid state
-                            error_count = 0
-                    else:
+                async for output in app.astream(stream_input, config):
+                    if "__interrupt__" in output:
+                        # This is an interrupt
+                        interrupt_value = output["__interrupt__"][0].value
+                        print(f"\nHuman feedback needed: {interrupt_value}")
+                        # The turn boundary is a natural flush point:
+                        # settle queued log rows onto disk while the user
+                        # is typing, with the blocking prompt on a worker
+                        # thread so the event loop stays free
+                        _, feedback = await asyncio.gather(
+                            _settle_logs(),
+                            asyncio.to_thread(input, "Your feedback: ")
+                        )
+                        feedback = feedback.strip()
+                        if not feedback:
+                            print("Ending conversation...")
+                            return
+
+                        # Log the human feedback (write-behind; the log
+                        # path is always known by this point)
+                        _enqueue_log(
+                            agent_name="Human",
+                            output=feedback,
+                            input_history=last_valid_state["history_str"],
+                            csv_file=last_valid_state["csv_file"]
+                        )
+
+                        # The human node applies the state update itself on
+                        # resume; mirror it here for display bookkeeping
+                        feedback_message = f"Human: {feedback}"
+                        last_valid_state = {
+                            **last_valid_state,
+                            "messages": last_valid_state["messages"] + [feedback_message],
+                            "phase": last_valid_state["phase"] + 1,
+                            "iteration": 0,
+                            "history_tokens": last_valid_state["history_tokens"] + count_tokens(f"\n{feedback_message}"),
+                            "history_str": last_valid_state["history_str"] + f"\n{feedback_message}",
+                            "next_agent_idx": 0
+                        }
+                        stream_input = Command(resume=feedback)
                         break
-            except StopIteration:
-                # This is expected when the workflow ends normally
-                break
+                    # Display agent outputs; nodes return deltas, so append
+                    # new messages and merge the other keys over the last
+                    # full state
+                    for node, node_update in output.items():
+                        if node == "round" or node in agent_names:
+                            new_messages = node_update.get("messages", [])
+                            node_state = {
+                                **last_valid_state,
+                                **node_update,
+                                "messages": last_valid_state["messages"] + new_messages
+                            }
+                            print(f"\nAgent {node} output:")
+                            print(f"Phase: {node_state['phase']}, Iteration: {node_state['iteration']}")
+                            print("\n".join(new_messages) if new_messages else node_state["messages"][-1])
+                            last_valid_state = node_state  # Update last valid state
+                    error_count = 0
+                else:
+                    # Stream exhausted without an interrupt: graph reached END
+                    break
             except Exception as e:
                 print(f"An error occurred: {e}")
                 error_count += 1
@@ -388,13 +837,27 @@ def main():
                     print(f"Too many consecutive errors ({MAX_ERRORS}). Ending conversation for safety.")
                     return
                 print("Attempting to continue the conversation...")
+                # Persist the checkpoint the failed superstep started from,
+                # so the resume below retries only that step
+                app.checkpointer.persist_withheld()
+                stream_input = None  # Resume from the last checkpoint
                 continue
     except KeyboardInterrupt:
         print("\nConversation interrupted by user.")
     finally:
+        # Settle any rows still queued before reporting the log location
+        await _settle_logs()
+        if _log_worker is not None:
+            _log_worker.cancel()
         print("\nConversation ended.")
-        if state.get("csv_file"):
-            print(f"Conversation log saved to: {state['csv_file']}")
+        if DEBUGGING_MODE:
+            print(f"Response cache: {_response_cache_stats['hits']} hits, {_response_cache_stats['misses']} misses")
+        if last_valid_state.get("csv_file"):
+            print(f"Conversation log saved to: {last_valid_state['csv_file']}")
+
+def main():
+    """Entry point: run the async driver to completion."""
+    asyncio.run(amain())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""Resume-path tests for SelectiveMemorySaver with a stubbed LLM.
+
+Both graph re-entry points go through the checkpointer: resuming with
+Command(resume=...) after a human interrupt, and resuming with None after
+an error. These tests drive the real compiled workflow against langgraph
+with the LLM, token counting and CSV logging stubbed out, and assert that
+the withheld-checkpoint replay restores the full state on both paths.
+
+Run from the repo root with: python -m unittest tests.test_resume
+"""
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from langgraph.types import Command
+
+import main
+
+
+def _agents():
+    return [
+        main.AgentConfig(
+            name="Research Agent",
+            system_prompt="You are a research agent.",
+            temperature=0.5
+        ),
+        main.AgentConfig(
+            name="Critical Agent",
+            system_prompt="You are a critical agent.",
+            temperature=0.3
+        )
+    ]
+
+
+def _initial_state(query="What should we build?"):
+    return {
+        "messages": [f"User Query: {query}"],
+        "phase": 1,
+        "iteration": 0,
+        "csv_file": "stub.csv",
+        "original_query": query,
+        "history_tokens": 0,
+        "history_str": f"User Query: {query}",
+        "next_agent_idx": 0,
+        "consecutive_votes": 0
+    }
+
+
+class ResumeTests(unittest.TestCase):
+    def setUp(self):
+        self._saved = {
+            name: getattr(main, name)
+            for name in ("_astream_content", "count_tokens", "_enqueue_log", "MAX_ITERATIONS")
+        }
+        self.calls = []
+        self.fail_on = None
+
+        async def fake_stream(llm, prompt):
+            self.calls.append(prompt)
+            if self.fail_on is not None and len(self.calls) == self.fail_on:
+                raise RuntimeError("transient LLM failure")
+            return f"stub reply {len(self.calls)}"
+
+        main._astream_content = fake_stream
+        main.count_tokens = lambda text, *args, **kwargs: len(text)
+        main._enqueue_log = lambda **kwargs: None
+        main.MAX_ITERATIONS = 2  # Two agent turns per phase, then the human node
+        main._response_cache.clear()
+        main._prefetch_tasks.clear()
+
+    def tearDown(self):
+        for name, value in self._saved.items():
+            setattr(main, name, value)
+        main._response_cache.clear()
+
+    def _build_app(self):
+        workflow = main.create_workflow(_agents())
+        return workflow.compile(checkpointer=main.SelectiveMemorySaver())
+
+    async def _stream_until_interrupt(self, app, stream_input, config):
+        interrupted = False
+        async for output in app.astream(stream_input, config):
+            if "__interrupt__" in output:
+                interrupted = True
+        return interrupted
+
+    def test_resume_after_interrupt(self):
+        async def run():
+            app = self._build_app()
+            config = {"configurable": {"thread_id": "t1"}}
+
+            self.assertTrue(await self._stream_until_interrupt(app, _initial_state(), config))
+
+            # Resuming re-runs human_feedback, which reads phase and the
+            # history fields from the checkpoint; a lost channel blob
+            # surfaces here as a KeyError
+            self.assertTrue(await self._stream_until_interrupt(app, Command(resume="keep going"), config))
+
+            snapshot = await app.aget_state(config)
+            self.assertEqual(snapshot.values["phase"], 2)
+            self.assertIn("Human: keep going", snapshot.values["messages"])
+            # Two turns per phase, two phases
+            self.assertEqual(len(self.calls), 4)
+
+        asyncio.run(run())
+
+    def test_resume_after_error(self):
+        async def run():
+            app = self._build_app()
+            config = {"configurable": {"thread_id": "t2"}}
+
+            self.fail_on = 2  # The Critical Agent's first call fails
+            with self.assertRaises(RuntimeError):
+                async for _ in app.astream(_initial_state(), config):
+                    pass
+            self.fail_on = None
+
+            # Mirror the driver's recovery: persist the withheld
+            # checkpoints, then resume from the latest one
+            app.checkpointer.persist_withheld()
+            self.assertTrue(await self._stream_until_interrupt(app, None, config))
+
+            snapshot = await app.aget_state(config)
+            research_turns = [
+                msg for msg in snapshot.values["messages"]
+                if msg.startswith("Research Agent:")
+            ]
+            # The successful turn before the failure was not replayed...
+            self.assertEqual(len(research_turns), 1)
+            # ...and recovery retried only the failed call: ok, failed, retried
+            self.assertEqual(len(self.calls), 3)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()